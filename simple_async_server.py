@@ -1,19 +1,84 @@
+import array
 import asyncio
+import atexit
 import logging
+import os
+import queue
+from collections.abc import Callable
+from logging.handlers import QueueHandler, QueueListener
 
 # Pymodbus imports organized by module
 from pymodbus.server import ModbusTcpServer
-from pymodbus.datastore import ModbusSequentialDataBlock, ModbusDeviceContext
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusDeviceContext, ModbusServerContext
 from pymodbus import ModbusDeviceIdentification
+from pymodbus.constants import ExcCodes
+
+# uvloop is optional: use it when installed, otherwise fall back to asyncio's
+# default event loop.
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+# Records are only enqueued on the event loop; a listener thread owns the
+# StreamHandler, so stderr writes never block the event loop.
+log_queue = queue.SimpleQueue()
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+log_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+logging.getLogger().addHandler(QueueHandler(log_queue))
+# Only warnings and errors by default; set LOG_LEVEL=INFO (or DEBUG) to see
+# the periodic updates.
+logging.getLogger().setLevel(os.environ.get("LOG_LEVEL", "WARNING").upper())
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logger = logging.getLogger("modbus-server")
 
 # Constants
 NUM_REGS = 50
 HOST = "0.0.0.0" # Use to enable external connections
 PORT = 5020  # Default port is 502, but 5020 avoids the need for root privileges.
+ENABLE_IDENTITY = False  # Set to True to answer device identification requests with build_identity()
+
+class RegisterDataBlock(ModbusSequentialDataBlock):
+    """
+    Sequential datablock that packs 16-bit registers into an array.array
+    instead of keeping one Python int object per register.
+    """
+
+    def __init__(self, address: int, values):
+        self.address = address
+        self.values = array.array("H", values)
+        self.default_value = 0
+
+    def default(self, count, value=0):
+        """Use to initialize a store to one value."""
+        self.default_value = value
+        self.values = array.array("H", [value]) * count
+        self.address = 0x00
+
+    def reset(self):
+        """Reset the datastore to the initialized default value."""
+        self.values = array.array("H", [self.default_value]) * len(self.values)
+
+    def getValues(self, address, count=1) -> list[int] | ExcCodes:
+        """Return the requested values as a new list."""
+        start = address - self.address
+        if start < 0 or len(self.values) < start + count:
+            return ExcCodes.ILLEGAL_ADDRESS
+        return memoryview(self.values)[start : start + count].tolist()
+
+    def setValues(self, address, values) -> None | ExcCodes:
+        """Set the requested values of the datastore."""
+        if not isinstance(values, list):
+            values = [values]
+        start = address - self.address
+        if start < 0 or len(self.values) < start + len(values):
+            return ExcCodes.ILLEGAL_ADDRESS
+        self.values[start : start + len(values)] = array.array("H", values)
+        return None
 
 def build_datastore() -> ModbusDeviceContext:
     """
@@ -21,14 +86,14 @@ def build_datastore() -> ModbusDeviceContext:
     """
     discrete_inputs = [False] * NUM_REGS
     coils = [False] * NUM_REGS
-    holding_registers = [i for i in range(NUM_REGS)]
-    input_registers = [1000 + i for i in range(NUM_REGS)]
+    holding_registers = list(range(NUM_REGS))
+    input_registers = list(range(1000, 1000 + NUM_REGS))
 
     store = ModbusDeviceContext(
         di=ModbusSequentialDataBlock(0, discrete_inputs),
         co=ModbusSequentialDataBlock(0, coils),
-        hr=ModbusSequentialDataBlock(0, holding_registers),
-        ir=ModbusSequentialDataBlock(0, input_registers),
+        hr=RegisterDataBlock(0, holding_registers),
+        ir=RegisterDataBlock(0, input_registers),
     )
     return store
 
@@ -43,63 +108,99 @@ def build_identity():
     identity.MajorMinorRevision = "3.x"
     return identity
 
-async def coils_task(context: ModbusDeviceContext, period: float = 1.0):
+def start_periodic_updates(context: ModbusDeviceContext, period: float = 1.0) -> Callable[[], None]:
     """
-    Asynchronous task that toggles the state of the coils.
+    Schedules a callback on the running loop that toggles the state of the
+    coils every period and increments the holding registers every other
+    period. Returns a function that stops the updates.
     """
+    loop = asyncio.get_running_loop()
+    next_time = loop.time()
+    tick = 0
     toggle_index = 0
+    handle = None
 
-    while True:
-        try:
-            address = 0
-            count = 10
-            
-            rr = context.getValues(1, address, count)
-            logger.info(f"Coils (0..9) before: {rr}")
-
-            new_coils = list(rr)
-            idx = toggle_index % count
-            new_coils[idx] = not new_coils[idx]
-
-            context.setValues(15, address, new_coils)
+    address = 0
+    coil_count = 16  # Power of two, so the index wraps with a mask
+    hr_count = 10
 
-            rr_after = context.getValues(1, address, count)
-            logger.info(f"Coils (0..9) after: {rr_after} (toggled idx={idx})")
+    # Bind hot lookups once, outside the callback.
+    getv = context.getValues
+    setv = context.setValues
+    info = logger.info
+    call_at = loop.call_at
 
-            toggle_index += 1
-        except Exception as e:
-            logger.exception(f"Error in coils task: {e}")
+    def update():
+        nonlocal next_time, tick, toggle_index, handle
 
-        await asyncio.sleep(period)
+        # Schedule the next run against a fixed deadline before doing any
+        # work, so the updates keep going even if this one fails and the
+        # time spent here does not accumulate as drift.
+        next_time += period
+        handle = call_at(next_time, update)
 
-async def holding_registers_task(context: ModbusDeviceContext, period: float = 2.0):
-    """
-    Asynchronous task that increments the holding registers.
-    """
-    while True:
+        # Only the datastore calls are guarded; getValues reports an invalid
+        # range by returning an ExcCodes value instead of a list.
         try:
-            address = 0
-            count = 10
-            
-            hr_vals = context.getValues(3, address, count)
-            logger.info(f"HR (0..9) before: {hr_vals}")
-
-            if hr_vals:
-                new_vals = list(hr_vals)
-                new_vals[0] = (new_vals[0] + 1) & 0xFFFF
-                
-                context.setValues(16, address, new_vals)
-
-            hr_after = context.getValues(3, address, count)
-            logger.info(f"HR (0..9) after: {hr_after}")
+            rr = getv(1, address, coil_count)
         except Exception as e:
-            logger.exception(f"Error in holding registers task: {e}")
-
-        await asyncio.sleep(period)
+            logger.exception("Error reading coils: %s", e)
+            rr = None
+
+        if isinstance(rr, list):
+            info("Coils (0..15) before: %s", rr)
+
+            # getValues returns a fresh slice of the datablock, so it can be
+            # modified in place without copying.
+            idx = toggle_index & 0x0F
+            rr[idx] = not rr[idx]
+
+            # Only one coil changed, so write just that one back.
+            try:
+                setv(5, address + idx, [rr[idx]])
+            except Exception as e:
+                logger.exception("Error writing coils: %s", e)
+            else:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Coils (0..15) after: %s (toggled idx=%d)", rr, idx)
+                toggle_index += 1
+
+        if tick % 2 == 0:
+            try:
+                hr_vals = getv(3, address, hr_count)
+            except Exception as e:
+                logger.exception("Error reading holding registers: %s", e)
+                hr_vals = None
+
+            if isinstance(hr_vals, list) and hr_vals:
+                info("HR (0..9) before: %s", hr_vals)
+
+                hr_vals[0] = (hr_vals[0] + 1) & 0xFFFF
+
+                # Only the first register changed, so write just that one back.
+                try:
+                    setv(6, address, [hr_vals[0]])
+                except Exception as e:
+                    logger.exception("Error writing holding registers: %s", e)
+                else:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("HR (0..9) after: %s", hr_vals)
+
+        tick += 1
+
+    def stop():
+        handle.cancel()
+
+    handle = loop.call_soon(update)
+    return stop
 
 async def main():
-    context = build_datastore()
-    identity = build_identity()
+    store = build_datastore()
+    identity = build_identity() if ENABLE_IDENTITY else None
+
+    # The server needs a server context, but the periodic updates work on the
+    # single device store directly instead of going through context[dev_id].
+    context = ModbusServerContext(devices=store, single=True)
 
     server = ModbusTcpServer(
         context=context,
@@ -107,23 +208,23 @@ async def main():
         address=(HOST, PORT)
     )
 
-    logger.info(f"Modbus TCP server started on {HOST}:{PORT}")
+    # Start listening before the periodic updates, so they only run once the
+    # server is actually up; a failed bind raises here instead.
+    await server.serve_forever(background=True)
+    logger.info("Modbus TCP server started on %s:%d", HOST, PORT)
 
-    task1 = asyncio.create_task(coils_task(context, period=1.0))
-    task2 = asyncio.create_task(holding_registers_task(context, period=2.0))
+    stop_updates = start_periodic_updates(store, period=1.0)
 
     try:
-        await server.serve_forever()
+        await server.serving
     except asyncio.CancelledError:
         logger.info("Server cancelled, shutting down...")
     finally:
-        task1.cancel()
-        task2.cancel()
-        await asyncio.gather(task1, task2, return_exceptions=True)
+        stop_updates()
         await server.shutdown()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(main(), loop_factory=uvloop.new_event_loop if uvloop else None)
     except KeyboardInterrupt:
         logger.info("Terminated by user (Ctrl+C)")
\ No newline at end of file